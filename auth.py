@@ -1,43 +1,85 @@
 from datetime import datetime, timedelta
 from typing import Optional, Dict
+from email.message import EmailMessage
+import asyncio
 import hashlib
+import hmac
 import secrets
+import string
 import base64
-import json
+import orjson
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from passlib.context import CryptContext
 import os
 
 # Secret key for token generation
 SECRET_KEY = "your-secret-key"  # In production, use a secure environment variable
+SECRET_KEY_BYTES = SECRET_KEY.encode()
 ALGORITHM = "HS256"  # We'll keep this for compatibility but won't use it
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # OAuth2 setup
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# PBKDF2 performance depends entirely on the OpenSSL build Python is linked
+# against: a build with SHA extensions (SHA-NI) runs the SHA-256 compression
+# function 5-8x faster than a plain software build. Python can't introspect
+# the CPU dispatch directly, so at least make sure the C implementation from
+# _hashlib is in use and surface the linked OpenSSL version for deployments.
+def _check_pbkdf2_backend():
+    if getattr(hashlib.pbkdf2_hmac, '__module__', None) != '_hashlib':
+        print("Warning: hashlib.pbkdf2_hmac is not OpenSSL-backed - "
+              "password hashing will be 5-8x slower on this build")
+    else:
+        import ssl
+        print(f"Password hashing backed by {ssl.OPENSSL_VERSION} "
+              "(build with SHA-NI support for fastest PBKDF2)")
+
+_check_pbkdf2_backend()
+
+# Password hashing context. bcrypt runs in native C and costs far less CPU
+# per verification than 100k PBKDF2 iterations at the same security level.
+# The cost factor is pinned so passlib skips its auto-calibration loop when
+# the backend loads.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
+
+# Verified against when a login names an unknown user, so a miss costs the
+# same as a wrong password and response timing doesn't reveal which usernames
+# exist. Computing it here also pre-warms the bcrypt backend, which passlib
+# otherwise loads lazily and which would add a few hundred ms to the first
+# login after boot.
+DUMMY_HASH = pwd_context.hash("!")
+
+def _verify_legacy_pbkdf2(plain_password, hashed_password):
+    """Verify against the old salt-hex + PBKDF2-hex formats"""
+    stored_hash = bytes.fromhex(hashed_password[32:])
+    password = plain_password.encode('utf-8')
+    # The original hasher fed the 32 hex salt chars to PBKDF2 as UTF-8
+    # text; a later revision decoded them to the 16 raw bytes first. The
+    # stored hash doesn't record which scheme minted it, so try both -
+    # UTF-8 first, since that's what any pre-existing deployment holds.
+    for salt in (hashed_password[:32].encode('utf-8'),
+                 bytes.fromhex(hashed_password[:32])):
+        new_hash = hashlib.pbkdf2_hmac('sha256', password, salt, 100000, dklen=32)
+        if hmac.compare_digest(new_hash, stored_hash):
+            return True
+    return False
+
 def verify_password(plain_password, hashed_password):
     """Verify a password against a hash"""
-    salt = hashed_password[:32]  # First 32 chars are the salt
-    stored_hash = hashed_password[32:]
-    new_hash = hashlib.pbkdf2_hmac(
-        'sha256', 
-        plain_password.encode('utf-8'), 
-        salt.encode('utf-8'), 
-        100000
-    ).hex()
-    return new_hash == stored_hash
+    # Hashes created before the passlib switch are plain hex strings
+    if pwd_context.identify(hashed_password) is None:
+        return _verify_legacy_pbkdf2(plain_password, hashed_password)
+    return pwd_context.verify(plain_password, hashed_password)
+
+def needs_rehash(hashed_password) -> bool:
+    """True for hashes still in the legacy PBKDF2 format"""
+    return pwd_context.identify(hashed_password) is None
 
 def get_password_hash(password):
     """Generate a salted hash for a password"""
-    salt = secrets.token_hex(16)
-    hash = hashlib.pbkdf2_hmac(
-        'sha256', 
-        password.encode('utf-8'), 
-        salt.encode('utf-8'), 
-        100000
-    ).hex()
-    return salt + hash
+    return pwd_context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a simple token without JWT dependency"""
@@ -48,33 +90,60 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire.timestamp()})
     
-    # Convert to JSON and encode in base64
-    json_str = json.dumps(to_encode)
-    token = base64.urlsafe_b64encode(json_str.encode()).decode()
-    
-    # Add a simple signature
-    signature = hashlib.sha256((token + SECRET_KEY).encode()).hexdigest()
-    return f"{token}.{signature}"
+    # Serialize and sign as bytes end to end; orjson emits bytes directly so
+    # the only str conversion is the final ascii decode at the wire boundary
+    token = base64.urlsafe_b64encode(orjson.dumps(to_encode))
+    sig = hmac.new(SECRET_KEY_BYTES, token, hashlib.sha256).digest()
+    return token.decode('ascii') + "." + base64.urlsafe_b64encode(sig).decode('ascii')
+
+# Cache of verified token payloads keyed by a short blake2b digest of the
+# token. Signature check, base64 decode and JSON parse are identical for
+# every request carrying the same token, so only the first request pays for
+# them. Expiry is still enforced on every decode_token call, so a cached
+# entry can never outlive its token; expired entries age out via FIFO
+# eviction once the cache fills.
+_TOKEN_CACHE_MAX = 10000
+_token_cache: Dict[bytes, dict] = {}
+
+# Structural fast path: every token we issue encodes an orjson object, so
+# its payload always starts with '{"', which pins the first two base64
+# characters; the signature is always a 44-char base64url SHA-256 digest.
+# Tokens failing either screen are rejected before any base64, JSON or HMAC
+# work.
+_PAYLOAD_PREFIX = base64.urlsafe_b64encode(b'{"')[:2]
+_SIGNATURE_LEN = len(base64.urlsafe_b64encode(b'\x00' * hashlib.sha256().digest_size))
+
+def _verify_and_parse(token: str) -> dict:
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    payload = _token_cache.get(key)
+    if payload is None:
+        # Split token and signature
+        token_part, _, signature = token.encode('ascii').partition(b'.')
+        if not token_part.startswith(_PAYLOAD_PREFIX) or len(signature) != _SIGNATURE_LEN:
+            raise ValueError("Malformed token")
+
+        # Verify the HMAC signature in constant time
+        sig = hmac.new(SECRET_KEY_BYTES, token_part, hashlib.sha256).digest()
+        if not hmac.compare_digest(signature, base64.urlsafe_b64encode(sig)):
+            raise ValueError("Invalid signature")
+
+        # Decode token; orjson parses the raw bytes without a decode pass
+        payload = orjson.loads(base64.urlsafe_b64decode(token_part))
+
+        if len(_token_cache) >= _TOKEN_CACHE_MAX:
+            del _token_cache[next(iter(_token_cache))]
+        _token_cache[key] = payload
+    return payload
 
 def decode_token(token: str):
     """Decode a token without JWT dependency"""
     try:
-        # Split token and signature
-        token_part, signature = token.split('.')
-        
-        # Verify signature
-        expected_signature = hashlib.sha256((token_part + SECRET_KEY).encode()).hexdigest()
-        if signature != expected_signature:
-            raise ValueError("Invalid signature")
-        
-        # Decode token
-        decoded = base64.urlsafe_b64decode(token_part).decode()
-        payload = json.loads(decoded)
-        
+        payload = _verify_and_parse(token)
+
         # Check expiration
         if datetime.utcnow().timestamp() > payload.get("exp", 0):
             raise ValueError("Token expired")
-            
+
         return payload
     except Exception as e:
         raise ValueError(f"Invalid token: {str(e)}")
@@ -83,7 +152,103 @@ def generate_verification_token():
     """Generate a random token for email verification"""
     return secrets.token_urlsafe(32)
 
+# SMTP configuration (see README for the expected .env entries). When
+# MAIL_SERVER is unset, emails fall back to being printed for local testing.
+MAIL_SERVER = os.getenv("MAIL_SERVER")
+MAIL_PORT = int(os.getenv("MAIL_PORT", "465"))
+MAIL_USERNAME = os.getenv("MAIL_USERNAME")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL_FROM = os.getenv("MAIL_FROM", MAIL_USERNAME or "noreply@localhost")
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "True").lower() in ("1", "true", "yes")
+
+# Outgoing emails go through a queue drained by a single worker that keeps
+# one SMTP connection open across messages. Session setup dominates the cost
+# of a send, so connecting per email would serialize signups on the
+# handshake; with the queue, senders return as soon as the message is built.
+_email_queue: "asyncio.Queue[EmailMessage]" = asyncio.Queue()
+
+# Email bodies are constant apart from the verification URL, so compile the
+# templates once at import instead of rebuilding the markup per send
+_VERIFY_HTML_TPL = string.Template("""\
+<html>
+  <body>
+    <p>Welcome! Please verify your email address by clicking the link below:</p>
+    <p><a href="$verify_url">Verify your email</a></p>
+    <p>If the link doesn't work, copy this URL into your browser:<br>
+    $verify_url</p>
+  </body>
+</html>""")
+_VERIFY_TEXT_TPL = string.Template("Verify your account: $verify_url")
+
 async def send_verification_email(email: str, token: str):
-    """Send a verification email (simplified for local testing)"""
+    """Queue a verification email for delivery"""
     verification_url = f"http://localhost:8000/verify/{token}"
-    print(f"Verification URL for {email}: {verification_url}")
\ No newline at end of file
+    if not MAIL_SERVER:
+        print(f"Verification URL for {email}: {verification_url}")
+        return
+
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = email
+    message["Subject"] = "Verify your email"
+    message.set_content(_VERIFY_TEXT_TPL.substitute(verify_url=verification_url))
+    message.add_alternative(
+        _VERIFY_HTML_TPL.substitute(verify_url=verification_url),
+        subtype="html",
+    )
+    await _email_queue.put(message)
+
+async def drain_email_queue(timeout: float = 10.0):
+    """Wait, bounded, for queued emails to be handed off to the server"""
+    try:
+        await asyncio.wait_for(_email_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        print(f"Email queue still holds {_email_queue.qsize()} message(s) "
+              f"after {timeout:.0f}s; shutting down anyway")
+
+async def email_worker():
+    """Drain the email queue over a single long-lived SMTP connection"""
+    import aiosmtplib
+
+    smtp = None
+    try:
+        while True:
+            message = await _email_queue.get()
+            try:
+                for attempt in (1, 2):
+                    try:
+                        if smtp is None:
+                            smtp = aiosmtplib.SMTP(
+                                hostname=MAIL_SERVER,
+                                port=MAIL_PORT,
+                                use_tls=MAIL_SSL_TLS,
+                                timeout=30,
+                            )
+                            await smtp.connect()
+                            if MAIL_USERNAME:
+                                await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+                        await smtp.send_message(message)
+                        break
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        # Connection may have gone stale between sends - drop it
+                        # and retry once on a fresh one before giving up
+                        if smtp is not None:
+                            try:
+                                await smtp.quit()
+                            except Exception:
+                                pass
+                            smtp = None
+                        if attempt == 2:
+                            print(f"Failed to send email to {message['To']}: {e}")
+            finally:
+                _email_queue.task_done()
+    finally:
+        # Close the session cleanly on cancellation instead of leaving the
+        # server with a dangling connection
+        if smtp is not None:
+            try:
+                await smtp.quit()
+            except Exception:
+                pass
\ No newline at end of file
@@ -1,6 +1,8 @@
 import os
-import json
+import orjson
 import shutil
+import asyncio
+import aiofiles
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 import uuid
@@ -22,126 +24,297 @@ REVIEWS_FILE = os.path.join(DATA_DIR, "reviews.json")
 def init_data_files():
     for file_path in [USERS_FILE, RESTAURANTS_FILE, REVIEWS_FILE]:
         if not os.path.exists(file_path):
-            with open(file_path, 'w') as f:
-                json.dump([], f)
+            with open(file_path, 'wb') as f:
+                f.write(orjson.dumps([]))
 
 init_data_files()
 
-# Helper functions to read and write JSON data
-def read_json(file_path: str) -> List[Dict]:
+# Synchronous read/write helpers for import-time initialisation, where no
+# event loop is running yet. Request-path code goes through the async
+# read_json/write_json below.
+def _read_json_sync(file_path: str) -> List[Dict]:
     try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
+        with open(file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    except (orjson.JSONDecodeError, FileNotFoundError):
         return []
 
-def write_json(file_path: str, data: List[Dict]):
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=2)
-
-# File upload handler
-async def save_file(file_data: bytes, file_name: str, content_type: str) -> str:
-    """Save a file locally and return its URL path"""
+def _write_json_sync(file_path: str, data: List[Dict]):
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_path, file_path)
+
+# Helper functions to read and write JSON data.
+# All writes go through this process, so once a file is loaded the cached
+# list is the authoritative copy and the file on disk is just its backup.
+# Each in-memory mutation bumps a per-file generation counter, which is what
+# the derived caches below key on. (Consequence: hand-editing the JSON files
+# while the app is running is no longer picked up - restart instead.)
+_parse_cache: Dict[str, List[Dict]] = {}
+_generation: Dict[str, int] = {}
+
+async def read_json(file_path: str) -> List[Dict]:
+    data = _parse_cache.get(file_path)
+    if data is None:
+        try:
+            async with aiofiles.open(file_path, 'rb') as f:
+                data = orjson.loads(await f.read())
+        except (orjson.JSONDecodeError, FileNotFoundError):
+            data = []
+        _parse_cache[file_path] = data
+        _generation.setdefault(file_path, 0)
+    return data
+
+# Lookup indexes built over the cached lists, keyed by generation so they
+# rebuild only when the table actually changes. Turns the per-lookup linear
+# scans below into single dict probes.
+_index_cache: Dict[tuple, tuple] = {}
+
+async def _index(file_path: str, field: str) -> Dict[Any, Dict]:
+    records = await read_json(file_path)
+    gen = _generation.get(file_path, 0)
+    entry = _index_cache.get((file_path, field))
+    if entry and entry[0] == gen:
+        return entry[1]
+    index = {record[field]: record for record in records if record.get(field) is not None}
+    _index_cache[(file_path, field)] = (gen, index)
+    return index
+
+# Serializes every read-modify-write cycle below. Without it two concurrent
+# requests could each read the same list, append their own record and write,
+# with the second write silently discarding the first.
+_write_lock = asyncio.Lock()
+
+async def write_json(file_path: str, data: List[Dict]):
+    # Write to a temp file and replace so readers never see a partial file
+    tmp_path = file_path + '.tmp'
+    async with aiofiles.open(tmp_path, 'wb') as f:
+        await f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_path, file_path)
+
+# Write-behind persistence. A mutation swaps the new list into the cache,
+# bumps the generation and marks the file dirty; the flush worker wakes up,
+# waits out a short coalescing window and writes each dirty file once. A
+# burst of requests against the same file therefore costs one serialization
+# and one atomic replace instead of one per request. Without a running
+# worker (scripts, import-time init) _commit degrades to a direct write so
+# nothing is ever left only in memory.
+FLUSH_WINDOW = 0.05
+
+_dirty: set = set()
+_flush_wakeup = asyncio.Event()
+_flush_task: Optional[asyncio.Task] = None
+
+async def _commit(file_path: str, data: List[Dict]):
+    _parse_cache[file_path] = data
+    _generation[file_path] = _generation.get(file_path, 0) + 1
+    if _flush_task is None or _flush_task.done():
+        # No live worker (not started, or it somehow died): write directly
+        # rather than acknowledging a mutation that nothing would persist
+        await write_json(file_path, data)
+    else:
+        _dirty.add(file_path)
+        _flush_wakeup.set()
+
+async def flush_worker():
+    """Batch dirty files into single atomic writes"""
+    while True:
+        await _flush_wakeup.wait()
+        await asyncio.sleep(FLUSH_WINDOW)
+        _flush_wakeup.clear()
+        for file_path in list(_dirty):
+            data = _parse_cache.get(file_path, [])
+            try:
+                await write_json(file_path, data)
+            except Exception as e:
+                # A transient write failure (disk full, EIO) must not kill
+                # the worker - that would turn every later commit into
+                # silent data loss. The file stays dirty; retry next pass.
+                # Cancellation is deliberately not caught, so a shutdown
+                # mid-write also leaves the path dirty for the final flush
+                # in stop_flush_worker.
+                print(f"Failed to flush {file_path}: {e}")
+                _flush_wakeup.set()
+            else:
+                # A commit that landed while the write was in flight has
+                # swapped in a newer list; keep the path dirty for it
+                if _parse_cache.get(file_path) is data:
+                    _dirty.discard(file_path)
+
+def start_flush_worker():
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(flush_worker())
+
+async def stop_flush_worker():
+    """Cancel the worker and flush anything still pending"""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # A worker that already died re-raises its stored exception
+            # here; swallow it so the final flush below still runs
+            print(f"Flush worker exited with error: {e}")
+        _flush_task = None
+    for file_path in list(_dirty):
+        _dirty.discard(file_path)
+        try:
+            await write_json(file_path, _parse_cache.get(file_path, []))
+        except Exception as e:
+            # One unwritable file shouldn't stop the rest from flushing or
+            # blow up the shutdown hook
+            print(f"Failed to flush {file_path} during shutdown: {e}")
+
+# File upload handler. 64 KiB is the sweet spot for copy buffers - large
+# enough that syscall and scheduling overhead stop mattering, small enough
+# to stay cache friendly.
+UPLOAD_BUFFER = 64 * 1024
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+
+async def save_file(upload, file_name: str, content_type: str,
+                    max_size: int = MAX_UPLOAD_SIZE) -> str:
+    """Stream an upload to disk and return its URL path.
+
+    Reads the UploadFile chunk by chunk so the whole payload never sits in
+    memory. Raises ValueError and removes the partial file if the stream
+    exceeds max_size.
+    """
     # Generate a unique filename to prevent collisions
     file_ext = os.path.splitext(file_name)[1]
     unique_filename = f"{uuid.uuid4()}{file_ext}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    # Save the file
-    with open(file_path, 'wb') as f:
-        f.write(file_data)
-    
+
+    bytes_written = 0
+    try:
+        async with aiofiles.open(file_path, 'wb', buffering=UPLOAD_BUFFER) as f:
+            while chunk := await upload.read(UPLOAD_BUFFER):
+                bytes_written += len(chunk)
+                if bytes_written > max_size:
+                    raise ValueError("File exceeds the maximum upload size")
+                await f.write(chunk)
+    except Exception:
+        if os.path.exists(file_path):
+            os.unlink(file_path)
+        raise
+
     # Return a relative URL to the file
     return f"/uploads/{unique_filename}"
 
 # User management
-def get_user_by_username(username: str) -> Optional[Dict]:
-    users = read_json(USERS_FILE)
-    for user in users:
-        if user.get("username") == username:
-            return user
-    return None
-
-def get_user_by_email(email: str) -> Optional[Dict]:
-    users = read_json(USERS_FILE)
-    for user in users:
-        if user.get("email") == email:
-            return user
-    return None
-
-def get_user_by_id(user_id: int) -> Optional[Dict]:
-    users = read_json(USERS_FILE)
-    for user in users:
-        if user.get("id") == user_id:
-            return user
-    return None
-
-def create_user(user_data: Dict) -> Dict:
-    users = read_json(USERS_FILE)
-    
-    # Generate a new ID
-    new_id = 1
-    if users:
-        new_id = max(user.get("id", 0) for user in users) + 1
-    
-    user_data["id"] = new_id
-    users.append(user_data)
-    write_json(USERS_FILE, users)
-    return user_data
-
-def update_user(user_id: int, updated_data: Dict) -> Optional[Dict]:
-    users = read_json(USERS_FILE)
-    for i, user in enumerate(users):
-        if user.get("id") == user_id:
-            users[i].update(updated_data)
-            write_json(USERS_FILE, users)
-            return users[i]
-    return None
+async def get_user_by_username(username: str) -> Optional[Dict]:
+    return (await _index(USERS_FILE, "username")).get(username)
+
+async def get_user_by_email(email: str) -> Optional[Dict]:
+    return (await _index(USERS_FILE, "email")).get(email)
+
+async def get_user_by_id(user_id: int) -> Optional[Dict]:
+    return (await _index(USERS_FILE, "id")).get(user_id)
+
+async def check_user_exists(username: str, email: str) -> tuple:
+    """Check username and email availability in a single storage read"""
+    return (
+        username in await _index(USERS_FILE, "username"),
+        email in await _index(USERS_FILE, "email"),
+    )
+
+async def create_user(user_data: Dict) -> Dict:
+    async with _write_lock:
+        users = list(await read_json(USERS_FILE))
+
+        # Generate a new ID
+        new_id = 1
+        if users:
+            new_id = max(user.get("id", 0) for user in users) + 1
+
+        user_data["id"] = new_id
+        users.append(user_data)
+        await _commit(USERS_FILE, users)
+        return user_data
+
+async def update_user(user_id: int, updated_data: Dict) -> Optional[Dict]:
+    async with _write_lock:
+        users = list(await read_json(USERS_FILE))
+        for i, user in enumerate(users):
+            if user.get("id") == user_id:
+                # Replace rather than mutate so cached indexes stay consistent
+                users[i] = {**user, **updated_data}
+                await _commit(USERS_FILE, users)
+                return users[i]
+        return None
+
+async def get_user_by_verification_token(token: str) -> Optional[Dict]:
+    """Look up the user holding an outstanding verification token"""
+    # Verified users carry token None, which the index skips
+    return (await _index(USERS_FILE, "verification_token")).get(token)
+
+async def verify_user_by_token(token: str) -> Optional[Dict]:
+    """Mark the user holding this verification token as verified.
+
+    Finds and updates the user in a single read-modify-write cycle and
+    returns the updated record, or None if no user holds the token.
+    """
+    async with _write_lock:
+        # Index probe first: unknown tokens (the common case when bots scan
+        # /verify URLs) bail out without walking the user list
+        user = await get_user_by_verification_token(token)
+        if user is None:
+            return None
+
+        users = list(await read_json(USERS_FILE))
+        for i, u in enumerate(users):
+            if u.get("id") == user["id"]:
+                users[i] = {**u, "is_verified": 1, "verification_token": None}
+                await _commit(USERS_FILE, users)
+                return users[i]
+        return None
 
 # Restaurant management
-def get_restaurants(skip: int = 0, limit: int = 10) -> List[Dict]:
-    restaurants = read_json(RESTAURANTS_FILE)
+async def get_restaurants(skip: int = 0, limit: int = 10) -> List[Dict]:
+    restaurants = await read_json(RESTAURANTS_FILE)
     return restaurants[skip:skip+limit]
 
-def get_restaurant_by_id(restaurant_id: int) -> Optional[Dict]:
-    restaurants = read_json(RESTAURANTS_FILE)
-    for restaurant in restaurants:
-        if restaurant.get("id") == restaurant_id:
-            return restaurant
-    return None
+async def get_restaurant_by_id(restaurant_id: int) -> Optional[Dict]:
+    return (await _index(RESTAURANTS_FILE, "id")).get(restaurant_id)
 
-def create_restaurant(restaurant_data: Dict) -> Dict:
-    restaurants = read_json(RESTAURANTS_FILE)
-    
-    # Generate a new ID
-    new_id = 1
-    if restaurants:
-        new_id = max(restaurant.get("id", 0) for restaurant in restaurants) + 1
-    
-    restaurant_data["id"] = new_id
-    restaurants.append(restaurant_data)
-    write_json(RESTAURANTS_FILE, restaurants)
-    return restaurant_data
+async def create_restaurant(restaurant_data: Dict) -> Dict:
+    async with _write_lock:
+        restaurants = list(await read_json(RESTAURANTS_FILE))
+
+        # Generate a new ID
+        new_id = 1
+        if restaurants:
+            new_id = max(restaurant.get("id", 0) for restaurant in restaurants) + 1
+
+        restaurant_data["id"] = new_id
+        restaurants.append(restaurant_data)
+        await _commit(RESTAURANTS_FILE, restaurants)
+        return restaurant_data
 
 # Review management
-def get_reviews_by_restaurant(restaurant_id: int, skip: int = 0, limit: int = 10) -> List[Dict]:
-    reviews = read_json(REVIEWS_FILE)
+async def get_reviews_by_restaurant(restaurant_id: int, skip: int = 0, limit: int = 10) -> List[Dict]:
+    reviews = await read_json(REVIEWS_FILE)
     restaurant_reviews = [r for r in reviews if r.get("restaurant_id") == restaurant_id]
     return restaurant_reviews[skip:skip+limit]
 
-def create_review(review_data: Dict) -> Dict:
-    reviews = read_json(REVIEWS_FILE)
-    
-    # Generate a new ID
-    new_id = 1
-    if reviews:
-        new_id = max(review.get("id", 0) for review in reviews) + 1
-    
-    review_data["id"] = new_id
-    review_data["created_at"] = datetime.now().isoformat()
-    reviews.append(review_data)
-    write_json(REVIEWS_FILE, reviews)
-    return review_data
+async def create_review(review_data: Dict) -> Dict:
+    async with _write_lock:
+        reviews = list(await read_json(REVIEWS_FILE))
+
+        # Generate a new ID
+        new_id = 1
+        if reviews:
+            new_id = max(review.get("id", 0) for review in reviews) + 1
+
+        review_data["id"] = new_id
+        review_data["created_at"] = datetime.now().isoformat()
+        reviews.append(review_data)
+        await _commit(REVIEWS_FILE, reviews)
+        return review_data
 
 # Add these functions to local_storage.py
 
@@ -151,72 +324,99 @@ ADMINS_FILE = os.path.join(DATA_DIR, "admins.json")
 # Initialize admin data file
 def init_admin_file():
     if not os.path.exists(ADMINS_FILE):
-        with open(ADMINS_FILE, 'w') as f:
-            json.dump([], f)
+        with open(ADMINS_FILE, 'wb') as f:
+            f.write(orjson.dumps([]))
 
 init_admin_file()
 
+# Admin membership is checked on every admin endpoint, so keep the emails in
+# a module-level frozenset. Rebinding a fresh frozenset on the (rare) writes
+# is atomic under the GIL, and is_admin becomes a hash probe with no file IO.
+_admin_emails: frozenset = frozenset()
+
+def _rebuild_admin_set(admins: Optional[List[Dict]] = None):
+    global _admin_emails
+    if admins is None:
+        admins = _read_json_sync(ADMINS_FILE)
+    _admin_emails = frozenset(admin.get("email") for admin in admins)
+
+_rebuild_admin_set()
+
 # Admin management
 def is_admin(email: str) -> bool:
     """Check if a user has admin access"""
-    admins = read_json(ADMINS_FILE)
-    return any(admin.get("email") == email for admin in admins)
+    return email in _admin_emails
 
-def add_admin(email: str) -> bool:
+async def add_admin(email: str) -> bool:
     """Add admin access for a user"""
-    if is_admin(email):
-        return False
-    
-    admins = read_json(ADMINS_FILE)
-    admins.append({"email": email})
-    write_json(ADMINS_FILE, admins)
-    return True
+    async with _write_lock:
+        admins = list(await read_json(ADMINS_FILE))
+        if any(admin.get("email") == email for admin in admins):
+            return False
+
+        admins.append({"email": email})
+        await _commit(ADMINS_FILE, admins)
+        _rebuild_admin_set(admins)
+        return True
 
-def remove_admin(email: str) -> bool:
+async def remove_admin(email: str) -> bool:
     """Remove admin access for a user"""
-    admins = read_json(ADMINS_FILE)
-    initial_count = len(admins)
-    admins = [admin for admin in admins if admin.get("email") != email]
-    
-    if len(admins) < initial_count:
-        write_json(ADMINS_FILE, admins)
-        return True
-    return False
+    async with _write_lock:
+        admins = await read_json(ADMINS_FILE)
+        initial_count = len(admins)
+        admins = [admin for admin in admins if admin.get("email") != email]
+
+        if len(admins) < initial_count:
+            await _commit(ADMINS_FILE, admins)
+            _rebuild_admin_set(admins)
+            return True
+        return False
 
-def get_all_admins() -> List[Dict]:
+async def get_all_admins() -> List[Dict]:
     """Get all users with admin access"""
-    return read_json(ADMINS_FILE)
+    return await read_json(ADMINS_FILE)
 
-def get_all_users() -> List[Dict]:
+async def get_all_users() -> List[Dict]:
     """Get all users"""
-    return read_json(USERS_FILE)
+    return await read_json(USERS_FILE)
+
+# Enriched review list cached until any of its three source tables changes,
+# so repeated dashboard refreshes don't redo the join
+_reviews_cache: Dict[str, Any] = {"key": None, "data": None}
 
-def get_all_reviews() -> List[Dict]:
+async def get_all_reviews() -> List[Dict]:
     """Get all reviews with user and restaurant info"""
-    reviews = read_json(REVIEWS_FILE)
-    users = {user["id"]: user for user in read_json(USERS_FILE)}
-    restaurants = {restaurant["id"]: restaurant for restaurant in read_json(RESTAURANTS_FILE)}
-    
+    reviews = await read_json(REVIEWS_FILE)
+    users = await _index(USERS_FILE, "id")
+    restaurants = await _index(RESTAURANTS_FILE, "id")
+
+    key = (
+        _generation.get(REVIEWS_FILE, 0),
+        _generation.get(USERS_FILE, 0),
+        _generation.get(RESTAURANTS_FILE, 0),
+    )
+    if _reviews_cache["key"] == key:
+        return _reviews_cache["data"]
+
+    # Build new dicts rather than mutating the ones held by the read cache
+    enriched = []
     for review in reviews:
-        user_id = review.get("user_id")
-        restaurant_id = review.get("restaurant_id")
-        
-        if user_id in users:
-            review["username"] = users[user_id].get("username", "Unknown")
-        else:
-            review["username"] = "Unknown"
-            
-        if restaurant_id in restaurants:
-            review["restaurant_name"] = restaurants[restaurant_id].get("name", "Unknown")
-        else:
-            review["restaurant_name"] = "Unknown"
-    
-    return reviews
+        user = users.get(review.get("user_id"))
+        restaurant = restaurants.get(review.get("restaurant_id"))
+        enriched.append({
+            **review,
+            "username": user.get("username", "Unknown") if user else "Unknown",
+            "restaurant_name": restaurant.get("name", "Unknown") if restaurant else "Unknown",
+        })
+
+    _reviews_cache["key"] = key
+    _reviews_cache["data"] = enriched
+    return enriched
 
 # Initialize the first admin (your email)
 # Update the imports at the top of the file
 import os
-import json
+import orjson
 import shutil
 from datetime import datetime
 from typing import Dict, List, Optional, Any
@@ -229,8 +429,8 @@ load_dotenv()
 # Update the init_first_admin function
 def init_first_admin():
     """Initialize admin users from .env file"""
-    admins = read_json(ADMINS_FILE)
-    
+    admins = list(_read_json_sync(ADMINS_FILE))
+
     # Get admin emails from .env file
     admin_emails = os.getenv("ADMINS", "")
     if admin_emails:
@@ -250,7 +450,8 @@ def init_first_admin():
         print(f"No admins specified in .env, initialized default admin: {default_email}")
     
     # Save the updated admin list
-    write_json(ADMINS_FILE, admins)
+    _write_json_sync(ADMINS_FILE, admins)
+    _rebuild_admin_set(admins)
 
 # Call this function to ensure admins are initialized
 init_first_admin()
\ No newline at end of file
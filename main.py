@@ -1,35 +1,90 @@
 from datetime import timedelta
 from typing import List, Dict, Optional
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Form, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Form, File, UploadFile, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+import asyncio
+import hashlib
+import hmac
 import os
+import time
 import aiofiles
 from PIL import Image
 import uuid
 import json
-from pydantic import BaseModel
+from pydantic import BaseModel, EmailStr
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# uvloop's libuv event loop roughly halves per-request loop overhead for
+# an app like this where every endpoint is async IO. uvicorn picks it up
+# automatically once installed; setting the policy here also covers being
+# run under plain asyncio entrypoints. Optional because uvloop doesn't
+# build on Windows.
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 # Import local storage instead of database
 import local_storage
 from auth import (
     create_access_token,
     verify_password,
+    needs_rehash,
     get_password_hash,
     ACCESS_TOKEN_EXPIRE_MINUTES,
+    DUMMY_HASH,
+    SECRET_KEY_BYTES,
     generate_verification_token,
     send_verification_email,
+    email_worker,
+    drain_email_queue,
     decode_token
 )
 
-app = FastAPI()
+# orjson serializes list-heavy responses several times faster than the
+# stdlib json encoder behind the default JSONResponse
+app = FastAPI(default_response_class=ORJSONResponse)
+
+@app.on_event("startup")
+async def start_email_worker():
+    app.state.email_worker = asyncio.create_task(email_worker())
+
+@app.on_event("startup")
+async def start_storage_flusher():
+    # Coalesces bursts of storage writes into single batched flushes
+    local_storage.start_flush_worker()
+
+@app.on_event("startup")
+async def init_admins():
+    # Sync the admin list with .env once per process; it used to be re-run
+    # on every /admin/check-access request
+    local_storage.init_first_admin()
+
+@app.on_event("shutdown")
+async def stop_email_worker():
+    # Deliver whatever is still queued (bounded wait) before cancelling;
+    # the worker quits its SMTP session as it unwinds
+    await drain_email_queue()
+    app.state.email_worker.cancel()
+    try:
+        await app.state.email_worker
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        print(f"Email worker exited with error: {e}")
+
+@app.on_event("shutdown")
+async def stop_storage_flusher():
+    # Writes out any batches still pending before the process exits
+    await local_storage.stop_flush_worker()
 
 # Mount the uploads directory to serve files
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -91,13 +146,77 @@ class Review(BaseModel):
 class AdminEmail(BaseModel):
     email: str
 
+# In-process cache of authenticated users so get_current_user doesn't hit
+# storage on every request. Entries live for USER_CACHE_TTL seconds and are
+# dropped explicitly whenever a user record changes.
+USER_CACHE_TTL = 300
+_user_cache: Dict[str, tuple] = {}
+
+def _cached_user(username: str) -> Optional[Dict]:
+    entry = _user_cache.get(username)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _cache_user(user: Dict):
+    _user_cache[user["username"]] = (time.monotonic() + USER_CACHE_TTL, user)
+
+def _invalidate_user_cache(username: str):
+    _user_cache.pop(username, None)
+
+# Short-lived cache of credential check outcomes so a client re-logging in
+# with identical credentials doesn't pay the bcrypt cost each time. Keys are
+# HMAC digests of the credentials under the server secret, so raw passwords
+# never sit in memory and entries can't be reversed.
+CRED_CACHE_TTL = 60
+CRED_CACHE_MAX = 1024
+_cred_cache: Dict[bytes, tuple] = {}
+
+def _cred_key(username: str, password: str) -> bytes:
+    return hmac.new(
+        SECRET_KEY_BYTES, f"{username}:{password}".encode(), hashlib.sha256
+    ).digest()
+
+def _cache_cred(key: bytes, valid: bool):
+    if len(_cred_cache) >= CRED_CACHE_MAX:
+        del _cred_cache[next(iter(_cred_cache))]
+    _cred_cache[key] = (time.monotonic() + CRED_CACHE_TTL, valid)
+
 # Authentication functions
-def authenticate_user(username: str, password: str) -> Optional[Dict]:
-    user = local_storage.get_user_by_username(username)
+async def authenticate_user(username: str, password: str) -> Optional[Dict]:
+    # The cache probe comes before the user lookup and covers unknown
+    # usernames too; if only real accounts could hit the fast path, the
+    # hit-vs-miss timing gap would leak which usernames exist
+    key = _cred_key(username, password)
+    entry = _cred_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        if not entry[1]:
+            return None
+        return await local_storage.get_user_by_username(username)
+
+    user = await local_storage.get_user_by_username(username)
     if not user:
+        # Burn the same hashing cost as a real verification so unknown
+        # usernames aren't distinguishable by response time
+        verify_password(password, DUMMY_HASH)
+        _cache_cred(key, False)
         return None
-    if not verify_password(password, user.get("hashed_password")):
+
+    valid = verify_password(password, user.get("hashed_password"))
+    _cache_cred(key, valid)
+
+    if not valid:
         return None
+
+    # Successful login with a legacy PBKDF2 hash: upgrade it to bcrypt now,
+    # while the plaintext is in hand
+    if needs_rehash(user.get("hashed_password")):
+        updated = await local_storage.update_user(
+            user["id"], {"hashed_password": get_password_hash(password)}
+        )
+        _invalidate_user_cache(username)
+        if updated:
+            user = updated
     return user
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict:
@@ -110,13 +229,26 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict:
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        user = local_storage.get_user_by_username(username)
+        # Tokens carry the user fields the dependencies need, so requests
+        # bearing them never touch storage; older tokens without the extra
+        # claims fall back to a lookup
+        if "uid" in payload:
+            return {
+                "id": payload["uid"],
+                "username": username,
+                "email": payload.get("email"),
+                "is_verified": payload.get("v", 0),
+            }
+        user = _cached_user(username)
         if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+            user = await local_storage.get_user_by_username(username)
+            if user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            _cache_user(user)
         return user
     except Exception:
         raise HTTPException(
@@ -125,8 +257,22 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+async def get_admin_user(current_user: Dict = Depends(get_current_user)) -> Dict:
+    """Resolve the current user and require admin membership"""
+    if not local_storage.is_admin(current_user.get("email")):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have admin access"
+        )
+    return current_user
+
 async def get_verified_user(current_user: Dict = Depends(get_current_user)) -> Dict:
     if not current_user.get("is_verified"):
+        # The token claim may predate a recent verification - confirm
+        # against storage before rejecting
+        user = await local_storage.get_user_by_username(current_user["username"])
+        if user and user.get("is_verified"):
+            return user
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Email not verified"
@@ -139,15 +285,23 @@ async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.post("/register")
-async def register_user(username: str = Form(...), email: str = Form(...), password: str = Form(...)):
-    # Check if user already exists
-    if local_storage.get_user_by_username(username):
+async def register_user(
+    background_tasks: BackgroundTasks,
+    username: str = Form(...),
+    # Syntax-only validation: pydantic v2 calls email_validator with
+    # check_deliverability=False, so no DNS lookup ever blocks the request
+    email: EmailStr = Form(...),
+    password: str = Form(...)
+):
+    # Check username and email availability in one storage pass
+    username_taken, email_taken = await local_storage.check_user_exists(username, email)
+    if username_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
-    
-    if local_storage.get_user_by_email(email):
+
+    if email_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -165,10 +319,10 @@ async def register_user(username: str = Form(...), email: str = Form(...), passw
         "verification_token": verification_token
     }
     
-    user = local_storage.create_user(user_data)
+    user = await local_storage.create_user(user_data)
     
-    # Send verification email
-    await send_verification_email(email, verification_token)
+    # Queue the verification email after the response is sent
+    background_tasks.add_task(send_verification_email, email, verification_token)
     
     return {
         "message": "User registered successfully. Please check your email to verify your account.",
@@ -177,7 +331,7 @@ async def register_user(username: str = Form(...), email: str = Form(...), passw
 
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -186,23 +340,27 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["username"]}, expires_delta=access_token_expires
+        data={
+            "sub": user["username"],
+            "uid": user["id"],
+            "email": user["email"],
+            "v": user.get("is_verified", 0),
+        },
+        expires_delta=access_token_expires,
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/verify/{token}")
 async def verify_email(token: str):
-    users = local_storage.get_all_users()
-    for user in users:
-        if user.get("verification_token") == token:
-            # Update user verification status
-            local_storage.update_user(user["id"], {"is_verified": 1, "verification_token": None})
-            return {"message": "Email verified successfully"}
-    
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="Invalid verification token"
-    )
+    user = await local_storage.verify_user_by_token(token)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invalid verification token"
+        )
+
+    _invalidate_user_cache(user["username"])
+    return {"message": "Email verified successfully"}
 
 @app.get("/users/me", response_model=UserResponse)
 async def read_users_me(current_user: Dict = Depends(get_current_user)):
@@ -214,19 +372,51 @@ async def create_restaurant(
     current_user: Dict = Depends(get_current_user)
 ):
     restaurant_data = {"name": restaurant.name}
-    created_restaurant = local_storage.create_restaurant(restaurant_data)
+    created_restaurant = await local_storage.create_restaurant(restaurant_data)
     
     # Ensure the id is an integer
     created_restaurant["id"] = int(created_restaurant["id"])
     
     return created_restaurant
 
-@app.get("/restaurants/", response_model=List[Restaurant])
+# The list endpoints below serve dicts produced by our own storage layer,
+# so re-validating them against the response model on every request buys
+# nothing. model_construct() builds the models without validation (and still
+# drops fields outside the schema); response_model=None tells FastAPI not to
+# run its own validation pass on top.
+@app.get("/restaurants/", response_model=None)
 async def list_restaurants(
     skip: int = 0,
     limit: int = 10
 ):
-    return local_storage.get_restaurants(skip, limit)
+    restaurants = await local_storage.get_restaurants(skip, limit)
+    return [Restaurant.model_construct(**r) for r in restaurants]
+
+# Magic numbers for the image formats we accept. The client-supplied
+# Content-Type header is trivially spoofable, so the first bytes of the
+# actual payload are what gets checked.
+_IMAGE_MAGIC = (
+    b"\x89PNG\r\n\x1a\n",
+    b"\xff\xd8\xff",  # JPEG
+    b"GIF8",  # GIF87a / GIF89a
+)
+
+def _looks_like_image(head: bytes) -> bool:
+    """Sniff the leading bytes of an upload for a known image signature"""
+    if head.startswith(_IMAGE_MAGIC):
+        return True
+    # WEBP is a RIFF container with the format tag at offset 8
+    return head[:4] == b"RIFF" and head[8:12] == b"WEBP"
+
+def _verify_image(file_path: str):
+    """Check that a saved upload really decodes as an image.
+
+    verify() walks the file's structure without materializing pixel data,
+    so it stays cheap even at the 5MB cap. Raises on anything Pillow can't
+    parse.
+    """
+    with Image.open(file_path) as img:
+        img.verify()
 
 @app.post("/reviews/")
 async def create_review(
@@ -266,7 +456,7 @@ async def create_review(
         )
 
     # Check if restaurant exists
-    restaurant = local_storage.get_restaurant_by_id(restaurant_id_int)
+    restaurant = await local_storage.get_restaurant_by_id(restaurant_id_int)
     if not restaurant:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -275,20 +465,24 @@ async def create_review(
 
     image_url = None
     if image and image.filename:
-        if not image.content_type.startswith('image/'):
+        # Sniff the magic bytes rather than trusting image.content_type;
+        # rejects mislabelled files before anything touches the disk
+        head = await image.read(16)
+        await image.seek(0)
+        if not _looks_like_image(head):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="File must be an image"
             )
         try:
-            image_data = await image.read()
-            # Enforce 5MB limit based on actual bytes
-            if len(image_data) > 5 * 1024 * 1024:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Image size must be less than 5MB"
-                )
-            image_url = await local_storage.save_file(image_data, image.filename, image.content_type)
+            # Streamed to disk in chunks; the 5MB limit is enforced on the
+            # actual bytes as they arrive
+            image_url = await local_storage.save_file(image, image.filename, image.content_type)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Image size must be less than 5MB"
+            )
         except HTTPException:
             raise
         except Exception as e:
@@ -297,6 +491,18 @@ async def create_review(
                 detail=f"Failed to save image: {str(e)}"
             )
 
+        # Pillow decode is synchronous C work, so run it in a worker thread
+        # rather than stalling the event loop for every upload
+        saved_path = os.path.join(local_storage.UPLOAD_DIR, image_url.rsplit("/", 1)[1])
+        try:
+            await asyncio.to_thread(_verify_image, saved_path)
+        except Exception:
+            os.unlink(saved_path)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="File is not a valid image"
+            )
+
     # Create review
     review_data = {
         "text": comment,
@@ -306,7 +512,7 @@ async def create_review(
         "image_url": image_url
     }
     
-    created_review = local_storage.create_review(review_data)
+    created_review = await local_storage.create_review(review_data)
     
     return {
         "message": "Review created successfully",
@@ -314,13 +520,14 @@ async def create_review(
         "image_url": image_url
     }
 
-@app.get("/restaurants/{restaurant_id}/reviews/", response_model=List[Review])
+@app.get("/restaurants/{restaurant_id}/reviews/", response_model=None)
 async def list_restaurant_reviews(
     restaurant_id: int,
     skip: int = 0,
     limit: int = 10
 ):
-    return local_storage.get_reviews_by_restaurant(restaurant_id, skip, limit)
+    reviews = await local_storage.get_reviews_by_restaurant(restaurant_id, skip, limit)
+    return [Review.model_construct(**r) for r in reviews]
 
 # Admin endpoints
 @app.get("/admin")
@@ -328,58 +535,28 @@ async def admin_page(request: Request):
     return templates.TemplateResponse("admin.html", {"request": request})
 
 @app.get("/admin/check-access")
-async def check_admin_access(current_user: Dict = Depends(get_current_user)):
-    # Reload admin list to ensure it's up to date with .env
-    local_storage.init_first_admin()
-    
-    if not local_storage.is_admin(current_user.get("email")):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have admin access"
-        )
+async def check_admin_access(current_user: Dict = Depends(get_admin_user)):
     return {"admin": True}
 
 @app.get("/admin/users")
-async def get_admin_users(current_user: Dict = Depends(get_current_user)):
-    if not local_storage.is_admin(current_user.get("email")):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have admin access"
-        )
-    return local_storage.get_all_users()
+async def get_admin_users(current_user: Dict = Depends(get_admin_user)):
+    return await local_storage.get_all_users()
 
 @app.get("/admin/reviews")
-async def get_admin_reviews(current_user: Dict = Depends(get_current_user)):
-    if not local_storage.is_admin(current_user.get("email")):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have admin access"
-        )
-    return local_storage.get_all_reviews()
+async def get_admin_reviews(current_user: Dict = Depends(get_admin_user)):
+    return await local_storage.get_all_reviews()
 
 @app.get("/admin/admins")
-async def get_admin_list(current_user: Dict = Depends(get_current_user)):
-    if not local_storage.is_admin(current_user.get("email")):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have admin access"
-        )
-    return local_storage.get_all_admins()
+async def get_admin_list(current_user: Dict = Depends(get_admin_user)):
+    return await local_storage.get_all_admins()
 
 @app.post("/admin/add-admin")
 async def add_admin_access(
     admin_email: AdminEmail,
-    current_user: Dict = Depends(get_current_user)
+    current_user: Dict = Depends(get_admin_user)
 ):
-    # Check if current user is admin
-    if not local_storage.is_admin(current_user.get("email")):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have admin access"
-        )
-    
     # Check if user exists
-    user = local_storage.get_user_by_email(admin_email.email)
+    user = await local_storage.get_user_by_email(admin_email.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -387,7 +564,7 @@ async def add_admin_access(
         )
     
     # Add admin access
-    success = local_storage.add_admin(admin_email.email)
+    success = await local_storage.add_admin(admin_email.email)
     if not success:
         return {"message": "User already has admin access"}
     
@@ -396,15 +573,8 @@ async def add_admin_access(
 @app.post("/admin/remove-admin")
 async def remove_admin_access(
     admin_email: AdminEmail,
-    current_user: Dict = Depends(get_current_user)
+    current_user: Dict = Depends(get_admin_user)
 ):
-    # Check if current user is admin
-    if not local_storage.is_admin(current_user.get("email")):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have admin access"
-        )
-    
     # Prevent removing your own admin access
     if admin_email.email == current_user.get("email"):
         raise HTTPException(
@@ -413,7 +583,7 @@ async def remove_admin_access(
         )
     
     # Remove admin access
-    success = local_storage.remove_admin(admin_email.email)
+    success = await local_storage.remove_admin(admin_email.email)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
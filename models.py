@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Index, Integer, String, ForeignKey
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -10,7 +10,7 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_verified = Column(Integer, default=0)
-    verification_token = Column(String, unique=True, nullable=True)
+    verification_token = Column(String, unique=True, index=True, nullable=True)
     
     reviews = relationship("Review", back_populates="user")
 
@@ -25,9 +25,16 @@ class Restaurant(Base):
 class Review(Base):
     __tablename__ = "reviews"
 
+    # (restaurant_id, id) covers the hottest query - reviews for one
+    # restaurant in insertion order - without a separate sort step, and its
+    # prefix serves plain restaurant_id lookups too. The old single-column
+    # indexes on text and rating were never used by any query and only
+    # slowed inserts.
+    __table_args__ = (Index("ix_reviews_rest_id", "restaurant_id", "id"),)
+
     id = Column(Integer, primary_key=True, index=True)
-    text = Column(String, index=True)
-    rating = Column(Integer, index=True)
+    text = Column(String)
+    rating = Column(Integer)
     image_url = Column(String, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     restaurant_id = Column(Integer, ForeignKey("restaurants.id"))
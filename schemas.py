@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from typing import Optional
 
 class UserCreate(BaseModel):
@@ -19,8 +19,7 @@ class UserResponse(BaseModel):
     username: str
     email: str
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class RestaurantBase(BaseModel):
     name: str
@@ -31,8 +30,7 @@ class RestaurantCreate(RestaurantBase):
 class Restaurant(RestaurantBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ReviewBase(BaseModel):
     text: str
@@ -49,5 +47,4 @@ class Review(ReviewBase):
     user: UserResponse
     restaurant: Restaurant
 
-    class Config:
-        from_attributes = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
@@ -1,5 +1,8 @@
-from typing import Optional
+from typing import AsyncIterable, Optional
+import asyncio
+import aiofiles
 import httpx
+import orjson
 from fastapi import HTTPException
 import os
 from dotenv import load_dotenv
@@ -21,82 +24,163 @@ class UploadThingClient:
     def __init__(self):
         self.api_key = UPLOADTHING_SECRET
         self.base_url = "https://uploadthing.com/api"
-        
-    async def upload_file(self, file_data: bytes, file_name: str, content_type: str) -> Optional[str]:
+        # One client for the lifetime of the process. Opening a client per
+        # upload meant a fresh TCP+TLS handshake every time; the pool keeps
+        # connections warm between uploads, and HTTP/2 lets the presign POST
+        # and the file PUT share a single connection.
+        self._client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=50),
+            timeout=30.0,
+        )
+
+    async def aclose(self):
+        """Close the pooled connections; call this on app shutdown"""
+        await self._client.aclose()
+
+    async def _presign(self, file_name: str, content_type: str) -> dict:
+        """Request an upload slot and return its presigned record"""
         headers = {
             "X-Upload-Key": self.api_key,
             "Content-Type": "application/json",
         }
-        
+
+        # Get presigned URL
+        presign_response = await self._client.post(
+            f"{self.base_url}/uploadFiles",
+            headers=headers,
+            json={
+                "files": [{
+                    "name": file_name,
+                    "type": content_type,
+                }]
+            }
+        )
+
+        if presign_response.status_code != 200:
+            # Response.text is a property in httpx, not a coroutine - the
+            # old `await presign_response.text()` raised TypeError and
+            # masked the real error on every non-200 response
+            raise HTTPException(
+                status_code=presign_response.status_code,
+                detail=f"Failed to get upload URL: {presign_response.text}"
+            )
+
+        # Parse the raw bytes with orjson, skipping httpx's charset
+        # detection pass
+        try:
+            presigned_data = orjson.loads(presign_response.content)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Invalid JSON response from upload service: {str(e)}"
+            )
+
+        if not isinstance(presigned_data, dict) or 'data' not in presigned_data or not isinstance(presigned_data['data'], list):
+            raise HTTPException(
+                status_code=500,
+                detail="Invalid response format from upload service"
+            )
+
+        if not presigned_data['data'] or 'url' not in presigned_data['data'][0]:
+            raise HTTPException(
+                status_code=500,
+                detail="Missing upload URL in response"
+            )
+
+        return presigned_data['data'][0]
+
+    async def _put_file(self, presigned: dict, body, content_type: str,
+                        length: Optional[int] = None) -> str:
+        """PUT the file body to its presigned URL and return the file URL.
+
+        body may be bytes or an async byte iterator; for an iterator httpx
+        streams the chunks straight onto the socket, and the explicit
+        Content-Length keeps the transfer un-chunked for S3-style targets.
+        """
+        upload_headers = {"Content-Type": content_type}
+        if length is not None:
+            upload_headers["Content-Length"] = str(length)
+        upload_response = await self._client.put(
+            presigned['url'],
+            content=body,
+            headers=upload_headers
+        )
+
+        if upload_response.status_code != 200:
+            raise HTTPException(
+                status_code=upload_response.status_code,
+                detail=f"Failed to upload file: {upload_response.text}"
+            )
+
+        # Get the file URL from the presigned data
+        if 'fileUrl' not in presigned:
+            raise HTTPException(
+                status_code=500,
+                detail="Missing file URL in response"
+            )
+
+        return presigned['fileUrl']
+
+    async def upload_file(self, file_data: bytes, file_name: str, content_type: str) -> Optional[str]:
+        try:
+            presigned = await self._presign(file_name, content_type)
+            return await self._put_file(presigned, file_data, content_type)
+        except httpx.RequestError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Upload service connection error: {str(e)}"
+            )
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                raise e
+            raise HTTPException(
+                status_code=500,
+                detail=f"Upload failed: {str(e)}"
+            )
+
+    async def upload_stream(self, body: AsyncIterable[bytes], length: int,
+                            file_name: str, content_type: str) -> Optional[str]:
+        """Upload from an async byte stream without buffering it in memory.
+
+        Suited to relaying an incoming UploadFile: hand in its chunk
+        iterator and the known size, and the body flows request -> socket
+        in constant memory instead of sitting in RSS as one bytes object.
+        """
+        try:
+            presigned = await self._presign(file_name, content_type)
+            return await self._put_file(presigned, body, content_type, length=length)
+        except httpx.RequestError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Upload service connection error: {str(e)}"
+            )
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                raise e
+            raise HTTPException(
+                status_code=500,
+                detail=f"Upload failed: {str(e)}"
+            )
+
+    async def upload_from_path(self, file_path: str, file_name: str, content_type: str) -> Optional[str]:
+        """Upload a file from disk, overlapping the presign with the read.
+
+        The presign round-trip and the disk read are independent, so the
+        presign request is started as a task and the file is read while it
+        is in flight; for small files the network RTT is fully hidden
+        behind the IO.
+        """
         try:
-            async with httpx.AsyncClient() as client:
-                # Get presigned URL
-                presign_response = await client.post(
-                    f"{self.base_url}/uploadFiles",
-                    headers=headers,
-                    json={
-                        "files": [{
-                            "name": file_name,
-                            "type": content_type,
-                        }]
-                    }
-                )
-                
-                if presign_response.status_code != 200:
-                    error_text = await presign_response.text()
-                    raise HTTPException(
-                        status_code=presign_response.status_code,
-                        detail=f"Failed to get upload URL: {error_text}"
-                    )
-                
-                # Parse the JSON response without using await
-                presigned_data = None
-                try:
-                    presigned_data = presign_response.json()
-                except Exception as e:
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Invalid JSON response from upload service: {str(e)}"
-                    )
-                
-                if not isinstance(presigned_data, dict) or 'data' not in presigned_data or not isinstance(presigned_data['data'], list):
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Invalid response format from upload service"
-                    )
-                
-                if not presigned_data['data'] or 'url' not in presigned_data['data'][0]:
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Missing upload URL in response"
-                    )
-                
-                # Upload file to the presigned URL
-                upload_url = presigned_data['data'][0]['url']
-                upload_headers = {"Content-Type": content_type}
-                
-                upload_response = await client.put(
-                    upload_url,
-                    content=file_data,
-                    headers=upload_headers
-                )
-                
-                if upload_response.status_code != 200:
-                    error_text = await upload_response.text()
-                    raise HTTPException(
-                        status_code=upload_response.status_code,
-                        detail=f"Failed to upload file: {error_text}"
-                    )
-                
-                # Get the file URL from the presigned data
-                if 'fileUrl' not in presigned_data['data'][0]:
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Missing file URL in response"
-                    )
-                
-                return presigned_data['data'][0]['fileUrl']
-                
+            presign_task = asyncio.create_task(self._presign(file_name, content_type))
+            try:
+                async with aiofiles.open(file_path, 'rb') as f:
+                    file_data = await f.read()
+            except BaseException:
+                presign_task.cancel()
+                raise
+            presigned = await presign_task
+            return await self._put_file(presigned, file_data, content_type)
         except httpx.RequestError as e:
             raise HTTPException(
                 status_code=500,